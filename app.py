@@ -26,8 +26,7 @@ def main():
 
         if choice == "1":
             docs = rag.load_documents(urls)
-            chunk_docs = rag.split_documents(docs)
-            rag.create_qna_index(chunk_docs)
+            rag.create_qna_index(rag.iter_chunks(docs))
         elif choice == "2":
             docs = rag.load_documents(urls)
             rag.create_summary_index(docs)
@@ -44,9 +43,8 @@ def main():
           for res in results:
               context += convert_json_to_toon(res.page_content)
               context += "\n" + "-" * 10
-          answer = rag.get_answer(user_query, context)
           print("\nAnswer:")
-          print(answer)
+          rag.get_answer(user_query, context)
 
         elif choice == "5":
             user_query = input("\nEnter your query: ")
@@ -55,9 +53,8 @@ def main():
             for res in results:
                 context += convert_json_to_toon(res.page_content)
                 context += "\n" + "-" * 10
-            answer = rag.get_answer(user_query, context)
             print("\nAnswer:")
-            print(answer)
+            rag.get_answer(user_query, context)
         elif choice == "6":
             user_query = input("\nEnter your query: ")
             results = rag.query_summary_index(user_query)
@@ -65,9 +62,8 @@ def main():
             for res in results:
                 context += convert_json_to_toon(res.page_content)
                 context += "\n" + "-" * 10
-            answer = rag.get_answer(user_query, context)
             print("\nAnswer:")
-            print(answer)
+            rag.get_answer(user_query, context)
         elif choice == "7":
             break
         else:
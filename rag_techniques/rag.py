@@ -1,102 +1,321 @@
 import os
-import json
+import asyncio
 import time
+import re
 import uuid
+import hashlib
+import orjson
 import logging
-from openai import OpenAI
+import threading
+from collections import OrderedDict, deque
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from openai import APIError, AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
+from requests_cache import CachedSession
 from langchain_core.documents import Document
 from langchain_core.prompts import PromptTemplate
 from langchain_text_splitters import SentenceTransformersTokenTextSplitter
 from langchain_cohere import CohereEmbeddings
-from langchain_qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient, models
 from langchain_community.document_loaders import WebBaseLoader
+from langchain_community.document_loaders.web_base import default_header_template
+from rag_techniques.semantic_cache import SemanticCache
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Groq allows ~55 requests per minute on the QnA model; parallel calls plateau well before that.
+GROQ_MAX_REQUESTS = 55
+GROQ_RATE_PERIOD = 60
+QNA_MAX_WORKERS = 48
+# Additionally pause when Groq's headers report fewer remaining requests (per day) or tokens (per minute).
+GROQ_MIN_REMAINING_REQUESTS = QNA_MAX_WORKERS
+GROQ_MIN_REMAINING_TOKENS = 4000
+GROQ_MAX_RETRIES = 5
+# Chunks packed into a single QnA prompt; larger batches mean fewer calls but slower responses.
+QNA_CHUNKS_PER_CALL = 4
+EMBED_CACHE_SIZE = 256
+# Cohere's embed endpoint accepts at most 96 texts per request.
+EMBED_BATCH_SIZE = 96
+# On-disk HTTP cache for fetched web pages; stale entries are revalidated with ETag / Last-Modified.
+WEB_CACHE_NAME = "web_cache"
+WEB_CACHE_EXPIRY = timedelta(days=1)
+WEB_REQUEST_TIMEOUT = 10
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+
+
+def _parse_duration(value):
+    """Parse rate-limit reset values such as '7.66s', '2m59.56s' or '120ms' into seconds."""
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in _DURATION_RE.findall(value))
+
+
+class RateLimiter:
+    """
+    Sliding-window limiter allowing at most `max_calls` every `period` seconds across threads.
+    On top of the window, callers also pause until the reported reset time whenever the
+    x-ratelimit-* response headers show the request or token budget is nearly spent.
+    """
+
+    def __init__(self, max_calls, period, min_remaining_requests, min_remaining_tokens):
+        self.max_calls = max_calls
+        self.period = period
+        self.min_remaining = {"requests": min_remaining_requests, "tokens": min_remaining_tokens}
+        self._calls = deque()
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._resume_at:
+                    wait = self._resume_at - now
+                else:
+                    while self._calls and now - self._calls[0] >= self.period:
+                        self._calls.popleft()
+                    if len(self._calls) < self.max_calls:
+                        self._calls.append(now)
+                        return
+                    wait = self.period - (now - self._calls[0])
+            time.sleep(wait)
+
+    def update(self, headers):
+        for kind, threshold in self.min_remaining.items():
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            reset = headers.get(f"x-ratelimit-reset-{kind}")
+            if remaining is None or reset is None or int(remaining) >= threshold:
+                continue
+            delay = _parse_duration(reset)
+            logging.info(f"Only {remaining} {kind} left in the rate-limit window, pausing for {delay:.2f}s.")
+            with self._lock:
+                self._resume_at = max(self._resume_at, time.monotonic() + delay)
+
+
 class RAG:
     def __init__(self):
-        self.groq_client = OpenAI(base_url="https://api.groq.com/openai/v1", api_key=os.environ.get("GROQ_API_KEY"))
+        self.groq_client = OpenAI(base_url="https://api.groq.com/openai/v1", api_key=os.environ.get("GROQ_API_KEY"), max_retries=GROQ_MAX_RETRIES)
         self.google_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url="https://generativelanguage.googleapis.com/v1beta/openai/")
         self.embedder = CohereEmbeddings(model="embed-english-light-v3.0")
         self.qdrant_url = os.environ.get("QDRANT_DB_URL")
+        self.qdrant_client = QdrantClient(url=self.qdrant_url)
+        self.groq_limiter = RateLimiter(GROQ_MAX_REQUESTS, GROQ_RATE_PERIOD, GROQ_MIN_REMAINING_REQUESTS, GROQ_MIN_REMAINING_TOKENS)
+        self.answer_cache = SemanticCache(dim=384, threshold=0.9)
+        self._embed_cache = OrderedDict()
+        self._splitter = None
+        self.web_session = CachedSession(WEB_CACHE_NAME, backend="sqlite", expire_after=WEB_CACHE_EXPIRY)
+        # WebBaseLoader skips its own header setup when handed a session, so apply its defaults
+        # (browser-style headers and the USER_AGENT env value) here.
+        self.web_session.headers.update(default_header_template)
+
+    def _embed_query(self, user_query):
+        # LRU cache of query embeddings so repeated queries skip the Cohere round-trip.
+        if user_query in self._embed_cache:
+            self._embed_cache.move_to_end(user_query)
+            return self._embed_cache[user_query]
+        embedding = self.embedder.embed_query(user_query)
+        self._embed_cache[user_query] = embedding
+        if len(self._embed_cache) > EMBED_CACHE_SIZE:
+            self._embed_cache.popitem(last=False)
+        return embedding
+
+    def _embed_queries(self, user_queries):
+        # Embed every uncached query in a single Cohere call.
+        missing = list(dict.fromkeys(q for q in user_queries if q not in self._embed_cache))
+        if missing:
+            for user_query, embedding in zip(missing, self.embedder.embed(missing, input_type="search_query")):
+                self._embed_cache[user_query] = embedding
+            while len(self._embed_cache) > EMBED_CACHE_SIZE:
+                self._embed_cache.popitem(last=False)
+        return [self._embed_query(user_query) for user_query in user_queries]
+
+    @staticmethod
+    def _to_documents(hits):
+        return [Document(page_content=hit.payload["page_content"], metadata=hit.payload["metadata"]) for hit in hits]
+
+    def _search(self, collection_name, user_query, k=3):
+        # Query Qdrant directly with the cached embedding and rebuild Documents from the payload.
+        hits = self.qdrant_client.query_points(
+            collection_name=collection_name,
+            query=self._embed_query(user_query),
+            limit=k,
+            with_payload=True
+        ).points
+        return self._to_documents(hits)
+
+    def _search_batch(self, collection_name, user_queries, k=3):
+        # One embedding call and one Qdrant round-trip for all queries.
+        requests = [
+            models.QueryRequest(query=vector, limit=k, with_payload=True)
+            for vector in self._embed_queries(user_queries)
+        ]
+        responses = self.qdrant_client.query_batch_points(collection_name=collection_name, requests=requests)
+        return [self._to_documents(response.points) for response in responses]
+
+    def _index_documents(self, docs, collection_name):
+        # Embed in as few Cohere calls as possible, then upload the precomputed vectors
+        # using the page_content/metadata payload layout of langchain-qdrant.
+        if not docs:
+            logging.warning(f"No documents to index into {collection_name}.")
+            return
+        texts = [doc.page_content for doc in docs]
+        vectors = []
+        for i in range(0, len(texts), EMBED_BATCH_SIZE):
+            vectors.extend(self.embedder.embed_documents(texts[i:i + EMBED_BATCH_SIZE]))
+
+        if not self.qdrant_client.collection_exists(collection_name):
+            self.qdrant_client.create_collection(
+                collection_name=collection_name,
+                vectors_config=models.VectorParams(size=len(vectors[0]), distance=models.Distance.COSINE)
+            )
+        self.qdrant_client.upload_points(
+            collection_name=collection_name,
+            points=[
+                models.PointStruct(
+                    id=uuid.uuid4().hex,
+                    vector=vector,
+                    payload={"page_content": doc.page_content, "metadata": doc.metadata}
+                )
+                for doc, vector in zip(docs, vectors)
+            ],
+            wait=True
+        )
 
     def load_documents(self, urls):
         logging.info(f"Loading documents from {urls}")
-        web_loader = WebBaseLoader(urls)
-        docs = web_loader.load()
+        # Fetch every URL concurrently through the cached session, so reruns are served from disk.
+        def _load(url):
+            web_loader = WebBaseLoader(url, session=self.web_session, requests_kwargs={"timeout": WEB_REQUEST_TIMEOUT})
+            return web_loader.load()
+
+        with ThreadPoolExecutor(max_workers=max(len(urls), 1)) as executor:
+            docs = [doc for url_docs in executor.map(_load, urls) for doc in url_docs]
         logging.info(f"Loaded {len(docs)} documents.")
         return docs
 
+    def _get_splitter(self):
+        # Loading the sentence-transformers tokenizer is slow, so build the splitter once.
+        if self._splitter is None:
+            self._splitter = SentenceTransformersTokenTextSplitter(chunk_overlap=100)
+        return self._splitter
+
     def split_documents(self, docs):
         logging.info("Splitting documents into chunks.")
-        splitter = SentenceTransformersTokenTextSplitter(chunk_overlap=100)
-        chunk_docs = splitter.split_documents(docs)
+        chunk_docs = self._get_splitter().split_documents(docs)
         logging.info(f"Split documents into {len(chunk_docs)} chunks.")
         return chunk_docs
 
+    def iter_chunks(self, docs):
+        # Yield chunks one document at a time so consumers can start work before splitting finishes.
+        splitter = self._get_splitter()
+        for doc in docs:
+            for text in splitter.split_text(doc.page_content):
+                yield Document(page_content=text, metadata=dict(doc.metadata))
+
     def create_qna_index(self, chunk_docs):
         logging.info("Creating QnA index.")
         SYSTEM_PROMPT = """
-You are an assistant that generates only answerable questions from a given document chunk.
+You are an assistant that generates only answerable questions from given document chunks.
 
 Task:
-Given the text inside <DOCUMENT_CHUNK> tags, list 3 questions that can be answered directly and completely using ONLY the information in that text.
+For each <CHUNK> inside the <DOCUMENT_CHUNKS> tags, list 3 questions that can be answered directly and completely using ONLY the information in that chunk.
 
 Instructions:
-- Consider the chunk as your entire knowledge.
-- Generate exactly 3 question-answer pairs.
-- The answer for each question must be explicitly stated or clearly implied in the chunk.
+- Consider each chunk on its own as your entire knowledge; never mix information across chunks.
+- Generate exactly 3 question-answer pairs per chunk.
+- The answer for each question must be explicitly stated or clearly implied in its chunk.
 - Do NOT include any question that would require outside knowledge to answer.
 - Avoid duplicate or trivially rephrased questions.
 - Make each question standalone and clear.
+- Return one result per chunk, using the chunk's id attribute as the result id.
 - Your output MUST be a single valid JSON object that can be parsed in Python.
 Input:
-<DOCUMENT_CHUNK>
-{chunk}
-</DOCUMENT_CHUNK>
+<DOCUMENT_CHUNKS>
+{chunks}
+</DOCUMENT_CHUNKS>
 """
         prompt = PromptTemplate.from_template(SYSTEM_PROMPT)
-        qna_docs = []
 
-        for i, chunk in enumerate(chunk_docs):
-            if i != 0 and i % 55 == 0:
-                logging.info("Time to Sleep for 60secs..")
-                for i in range(60, 0, -1):
-                    time.sleep(1)
-                    print(f"{i} secs.. ", end="\r", flush=True)
-
-            sys_prmt = prompt.format(chunk=chunk.page_content)
-            response = self.groq_client.chat.completions.create(
-                messages=[{"role": "system", "content": sys_prmt + '- The JSON object must conform to this schema: `{"items": [{"Q": "<question>", "A": "<answer>"}]}`.'},
-                          {"role": "user",
-                           "content": "Generate 3 question-answer pairs based on the document chunk, following all instructions in the system prompt."}],
-                response_format={"type": "json_object"},
-                model="moonshotai/kimi-k2-instruct-0905")
-            
+        def _qna_for_batch(batch):
+            chunks = "\n".join(f'<CHUNK id="{j}">\n{chunk.page_content}\n</CHUNK>' for j, (_, chunk) in enumerate(batch))
+            sys_prmt = prompt.format(chunks=chunks)
+            self.groq_limiter.acquire()
             try:
-                queries = json.loads(response.choices[0].message.content)
-                for query in queries["items"]:
-                    user_query = query["Q"]
-                    answer = query["A"]
-                    doc = Document(
-                        page_content=f"Question: {user_query}\n Answer: {answer}",
-                        metadata={"id": str(uuid.uuid4()), "source": chunk.metadata["source"]}
-                    )
-                    qna_docs.append(doc)
-            except json.JSONDecodeError as e:
+                raw_response = self.groq_client.chat.completions.with_raw_response.create(
+                    messages=[{"role": "system", "content": sys_prmt + '- The JSON object must conform to this schema: `{"results": [{"id": <chunk id>, "items": [{"Q": "<question>", "A": "<answer>"}]}]}`.'},
+                              {"role": "user",
+                               "content": f"Generate 3 question-answer pairs for each of the {len(batch)} document chunks, following all instructions in the system prompt."}],
+                    response_format={"type": "json_object"},
+                    model="moonshotai/kimi-k2-instruct-0905")
+            except APIError as e:
+                # One failed batch must not discard the QnA pairs of every other batch.
+                logging.error(f"QnA generation failed for a batch of {len(batch)} chunks: {e}")
+                return []
+            self.groq_limiter.update(raw_response.headers)
+            response = raw_response.parse()
+
+            batch_items = []
+            try:
+                results = orjson.loads(response.choices[0].message.content)
+                for result in results["results"]:
+                    chunk_id = int(result["id"])
+                    if not 0 <= chunk_id < len(batch):
+                        logging.error(f"Ignoring QnA result with unknown chunk id: {result['id']}")
+                        continue
+                    key, _ = batch[chunk_id]
+                    items = [(query["Q"], query["A"]) for query in result["items"]]
+                    batch_items.append((key, items))
+            except orjson.JSONDecodeError as e:
                 logging.error(f"Failed to decode JSON: {e}")
                 logging.error(f"Invalid JSON string: {response.choices[0].message.content}")
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                logging.error(f"Unexpected QnA batch response shape: {e}")
+            return batch_items
 
+        # Identical chunks (e.g. navigation or footer boilerplate shared across pages) go to the
+        # LLM once; their QnA pairs are then reused for every copy with that copy's source.
+        # Batches are submitted as soon as they fill up, so splitting overlaps with the LLM calls.
+        groups = {}
+        pending = []
+        futures = []
+        chunk_count = 0
+        qna_docs = []
+        with ThreadPoolExecutor(max_workers=QNA_MAX_WORKERS) as executor:
+            for chunk in chunk_docs:
+                chunk_count += 1
+                key = hashlib.sha256(chunk.page_content.encode()).hexdigest()[:16]
+                if key in groups:
+                    groups[key].append(chunk)
+                    continue
+                groups[key] = [chunk]
+                pending.append((key, chunk))
+                if len(pending) == QNA_CHUNKS_PER_CALL:
+                    futures.append(executor.submit(_qna_for_batch, pending))
+                    pending = []
+            if pending:
+                futures.append(executor.submit(_qna_for_batch, pending))
+            if len(groups) < chunk_count:
+                logging.info(f"Skipped {chunk_count - len(groups)} duplicate chunks out of {chunk_count}.")
 
-        QdrantVectorStore.from_documents(
-            documents=qna_docs,
-            embedding=self.embedder,
-            collection_name="RAG QnA Docs",
-            url=self.qdrant_url
-        )
+            for future in as_completed(futures):
+                for key, items in future.result():
+                    for chunk in groups[key]:
+                        for user_query, answer in items:
+                            doc_text = f"Question: {user_query}\n Answer: {answer}"
+                            # Hash of text and source: cheaper than uuid4, and copies of a duplicated chunk
+                            # from different sources still get distinct ids.
+                            source = chunk.metadata["source"]
+                            doc_id = hashlib.blake2b(f"{source}\n{doc_text}".encode(), digest_size=8).hexdigest()
+                            doc = Document(
+                                page_content=doc_text,
+                                metadata={"id": doc_id, "source": source}
+                            )
+                            qna_docs.append(doc)
+
+        self._index_documents(qna_docs, "RAG QnA Docs")
         logging.info("QnA vector store created successfully.")
 
     def create_summary_index(self, docs):
@@ -104,72 +323,61 @@ Input:
         SYSTEM_PROMPT = "Summarize the following document clearly and concisely. Focus on preserving the main ideas, key details, and overall intent of the text without adding extra information or opinions. Output the summary in 2-3 sentences."
         
         doc_ids = [str(uuid.uuid4()) for _ in docs]
-        doc_map = [{"id": doc_ids[i], "doc": doc.page_content} for i, doc in enumerate(docs)]
 
-        with open("doc_map.json", "w") as f:
-            json.dump(doc_map, f)
+        # Summarize all documents concurrently. The async client is scoped to this event loop,
+        # since its connection pool cannot be reused across asyncio.run calls.
+        async def _summarize_all():
+            async with AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url="https://generativelanguage.googleapis.com/v1beta/openai/") as client:
+                async def _summarize(doc):
+                    response = await client.chat.completions.create(
+                        model="gemini-flash-lite-latest",
+                        messages=[
+                            {"role": "system", "content": SYSTEM_PROMPT},
+                            {"role": "user", "content": doc.page_content},
+                        ],
+                    )
+                    return response.choices[0].message.content
+
+                return await asyncio.gather(*(_summarize(doc) for doc in docs))
+
+        summaries = asyncio.run(_summarize_all())
 
         summary_docs = []
-        for i, doc in enumerate(docs):
-            user_query = doc.page_content
-            response = self.google_client.chat.completions.create(
-                model="gemini-flash-lite-latest",
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": user_query},
-                ],
-            )
-            summary = response.choices[0].message.content
+        for i, summary in enumerate(summaries):
             summary_doc = Document(
                 page_content=summary,
-                metadata={"id": doc_ids[i], "source": docs[i].metadata["source"]}
+                # Keep the full text in the Qdrant payload so summary hits carry their source document.
+                metadata={"id": doc_ids[i], "source": docs[i].metadata["source"], "full_text": docs[i].page_content}
             )
             summary_docs.append(summary_doc)
 
-        QdrantVectorStore.from_documents(
-            documents=summary_docs,
-            embedding=self.embedder,
-            collection_name="RAG Summary Docs",
-            url=self.qdrant_url
-        )
+        self._index_documents(summary_docs, "RAG Summary Docs")
         logging.info("Summary vector store created successfully.")
 
     def create_chunking_index(self,docs):
-        QdrantVectorStore.from_documents(
-            documents=docs,
-            embedding=self.embedder,
-            collection_name="RAG Chunking Docs",
-            url=self.qdrant_url
-        )
+        self._index_documents(docs, "RAG Chunking Docs")
         logging.info("Chunking vector store created successfully.")
 
     def query_qna_index(self, user_query):
         logging.info(f"Querying QnA index with: {user_query}")
-        vector_store = QdrantVectorStore.from_existing_collection(
-            embedding=self.embedder,
-            collection_name="RAG QnA Docs",
-            url=self.qdrant_url
-        )
-        results = vector_store.similarity_search(query=user_query, k=3)
+        results = self._search("RAG QnA Docs", user_query, k=3)
+        return results
+
+    def query_qna_index_batch(self, user_queries):
+        logging.info(f"Querying QnA index with {len(user_queries)} queries: {user_queries}")
+        if not user_queries:
+            return []
+        results = self._search_batch("RAG QnA Docs", user_queries, k=3)
         return results
 
     def query_summary_index(self, user_query):
         logging.info(f"Querying summary index with: {user_query}")
-        vector_store = QdrantVectorStore.from_existing_collection(
-            embedding=self.embedder,
-            collection_name="RAG Summary Docs",
-            url=self.qdrant_url
-        )
-        results = vector_store.similarity_search(query=user_query, k=3)
+        results = self._search("RAG Summary Docs", user_query, k=3)
         return results
     
     def query_chunking_index(self, user_query):
         logging.info(f"Querying chunking index with: {user_query}")
-        vector_store = QdrantVectorStore.from_existing_collection(
-            embedding=self.embedder,
-            collection_name="RAG Chunking Docs",
-            url=self.qdrant_url)
-        result = vector_store.similarity_search(query=user_query, k=3)
+        result = self._search("RAG Chunking Docs", user_query, k=3)
         return result
 
     def get_answer(self, user_query, context):
@@ -185,11 +393,30 @@ Input:
                 CONTEXT : 
                 {context}
                 """
+        query_embedding = self._embed_query(user_query)
+        context_hash = hashlib.sha256(context.encode()).hexdigest()
+        cached = self.answer_cache.lookup(query_embedding, key=context_hash)
+        if cached is not None:
+            logging.info("Answer served from semantic cache.")
+            print(cached, flush=True)
+            return cached
+
+        # Stream the answer so tokens are printed as soon as they arrive.
         response = self.google_client.chat.completions.create(
             model="gemini-flash-lite-latest",
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": user_query},
             ],
+            stream=True,
         )
-        return response.choices[0].message.content
+        buf = []
+        for chunk in response:
+            token = chunk.choices[0].delta.content if chunk.choices else None
+            if token:
+                print(token, end="", flush=True)
+                buf.append(token)
+        print(flush=True)
+        answer = "".join(buf)
+        self.answer_cache.add(query_embedding, answer, key=context_hash)
+        return answer
@@ -0,0 +1,76 @@
+import time
+import threading
+from typing import Any, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    In-process cache keyed by query embeddings.
+    - lookup returns the value stored for the most similar cached embedding when the
+      cosine similarity reaches `threshold` and the entry is younger than `ttl` seconds.
+    - entries can be scoped with an optional `key` (e.g. a context hash); only entries
+      with an equal key are considered a hit.
+    - holds at most `max_entries` entries, evicting the least recently used one.
+    """
+
+    def __init__(self, dim: int = 384, threshold: float = 0.9, ttl: float = 3600, max_entries: int = 1024):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._values: List[Any] = []
+        self._keys: List[Hashable] = []
+        self._created: List[float] = []
+        self._last_used: List[float] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def lookup(self, vector: Sequence[float], key: Optional[Hashable] = None) -> Optional[Any]:
+        if not self._values:
+            return None
+        q = self._normalize(vector)
+        with self._lock:
+            scores = self._vectors @ q
+            now = time.monotonic()
+            for i in np.argsort(scores)[::-1]:
+                if scores[i] < self.threshold:
+                    break
+                if self._keys[i] != key or now - self._created[i] > self.ttl:
+                    continue
+                self._last_used[i] = now
+                return self._values[i]
+        return None
+
+    def add(self, vector: Sequence[float], value: Any, key: Optional[Hashable] = None) -> None:
+        q = self._normalize(vector)
+        with self._lock:
+            now = time.monotonic()
+            if len(self._values) >= self.max_entries:
+                self._evict(now)
+            self._vectors = np.vstack([self._vectors, q[np.newaxis, :]])
+            self._values.append(value)
+            self._keys.append(key)
+            self._created.append(now)
+            self._last_used.append(now)
+
+    def _evict(self, now: float) -> None:
+        # Drop expired entries first, falling back to the least recently used one.
+        keep = [i for i, created in enumerate(self._created) if now - created <= self.ttl]
+        if len(keep) >= self.max_entries:
+            lru = min(keep, key=lambda i: self._last_used[i])
+            keep.remove(lru)
+        self._vectors = self._vectors[keep]
+        self._values = [self._values[i] for i in keep]
+        self._keys = [self._keys[i] for i in keep]
+        self._created = [self._created[i] for i in keep]
+        self._last_used = [self._last_used[i] for i in keep]
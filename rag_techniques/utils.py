@@ -1,22 +1,32 @@
-import json
+import re
+import orjson
 from collections import OrderedDict
 from typing import Any, List, Dict, Tuple
 
+# Characters that force a string value to be quoted.
+_SPECIAL_RE = re.compile(r'[,\n\r"]')
+# Cheap prefix test for text that can hold a JSON object or array.
+_JSON_START_RE = re.compile(r'\s*[\[{]')
+
 def _is_primitive(x):
     return x is None or isinstance(x, (str, int, float, bool))
 
-def _all_dicts_with_same_keys(lst: List[Any]) -> Tuple[bool, List[str]]:
+def _all_dicts_with_same_keys(lst: List[Any]) -> Tuple[bool, Tuple[str, ...]]:
     if not lst:
-        return False, []
+        return False, ()
     if not all(isinstance(el, dict) for el in lst):
-        return False, []
+        return False, ()
     # Use insertion order of keys from first element
-    keys = list(lst[0].keys())
+    keys = tuple(lst[0])
     for el in lst:
-        if list(el.keys()) != keys:
-            return False, []
+        if tuple(el) != keys:
+            return False, ()
     return True, keys
 
+def _tabular_rows(lst: List[Dict[str, Any]], cols: Tuple[str, ...], pad: str) -> str:
+    # Rows of a uniform dict array, one per line, joined in a single pass.
+    return "\n".join(f"{pad}{','.join(_format_value(item[c]) for c in cols)}" for item in lst)
+
 def _needs_quote(s: str) -> bool:
     # Minimal quoting rules (inspired by TOON description):
     # quote when the string contains the delimiter ',' or newline,
@@ -25,11 +35,7 @@ def _needs_quote(s: str) -> bool:
         return False
     if s == "":
         return True
-    if s[0].isspace() or s[-1].isspace():
-        return True
-    if any(ch in s for ch in [',', '\n', '\r', '"']):
-        return True
-    return False
+    return s[0].isspace() or s[-1].isspace() or _SPECIAL_RE.search(s) is not None
 
 def _quote_str(s: str) -> str:
     # escape double quotes and wrap in double quotes
@@ -51,129 +57,125 @@ def _format_value(v: Any) -> str:
         else:
             return v
     # for objects/arrays where a primitive expected, serialize to compact JSON as fallback
-    return _quote_str(json.dumps(v, separators=(',', ':')))
+    return _quote_str(orjson.dumps(v).decode())
 
-def json_to_toon(data: Any, name: str = None, indent: int = 0) -> str:
+def _to_toon(data: Any, out: List[str], indent: int = 0, name: str = None) -> None:
     """
-    Convert a Python object (from json.loads) into TOON format.
-    - name: optional name for the current node (used for top-level object keys)
-    - indent: internal use, number of spaces to indent nested blocks
-    Returns a TOON-format string.
+    Append the TOON lines for `data` to `out`.
+    Nested values recurse into the same `out` list so the text is joined only once.
     """
     pad = " " * indent
-    out_lines: List[str] = []
-
-    # Helper to write a named primitive or inline list
-    def write_named_line(key: str, line: str):
-        if indent:
-            out_lines.append(f"{pad}{key}{line}")
-        else:
-            out_lines.append(f"{key}{line}")
+    child_pad = " " * (indent + 2)
 
     # If top-level is a dict: iterate keys in insertion order
     if isinstance(data, dict):
         for k, v in data.items():
             # Objects -> key: newline then nested block
             if isinstance(v, dict):
-                out_lines.append(f"{pad}{k}:")
-                out_lines.append(json_to_toon(v, name=None, indent=indent + 2))
+                out.append(f"{pad}{k}:")
+                _to_toon(v, out, indent + 2)
             # Arrays -> try tabular optimization for uniform dict arrays or primitives
             elif isinstance(v, list):
                 lst = v
                 # empty list: emit length 0
                 if len(lst) == 0:
-                    out_lines.append(f"{pad}{k}[0]:")
+                    out.append(f"{pad}{k}[0]:")
                     continue
 
                 all_dicts, cols = _all_dicts_with_same_keys(lst)
                 if all_dicts:
                     # tabular array with header
                     header = "{" + ",".join(cols) + "}"
-                    out_lines.append(f"{pad}{k}[{len(lst)}]{header}:")
+                    out.append(f"{pad}{k}[{len(lst)}]{header}:")
                     # each row
-                    for item in lst:
-                        row_vals = [_format_value(item[c]) for c in cols]
-                        out_lines.append(f"{pad}{','.join(row_vals)}")
+                    out.append(_tabular_rows(lst, cols, pad))
                 elif all(_is_primitive(el) for el in lst):
                     # array of primitives -> inline comma-separated
                     vals = [_format_value(el) for el in lst]
-                    out_lines.append(f"{pad}{k}[{len(lst)}]: {','.join(vals)}")
+                    out.append(f"{pad}{k}[{len(lst)}]: {','.join(vals)}")
                 else:
                     # mixed or non-uniform -> list block with each element printed as nested block
-                    out_lines.append(f"{pad}{k}[{len(lst)}]:")
+                    out.append(f"{pad}{k}[{len(lst)}]:")
                     for el in lst:
                         # For primitives, write a single-line value
                         if _is_primitive(el):
-                            out_lines.append(f'{" " * (indent + 2)}{_format_value(el)}')
+                            out.append(f"{child_pad}{_format_value(el)}")
                         else:
                             # complex element: recurse with increased indent
-                            out_lines.append(json_to_toon(el, name=None, indent=indent + 2))
+                            _to_toon(el, out, indent + 2)
             else:
                 # primitive value
-                out_lines.append(f"{pad}{k}: {_format_value(v)}")
-        return "\n".join(out_lines)
+                out.append(f"{pad}{k}: {_format_value(v)}")
+        return
 
     # If top-level is a list (no key provided)
     if isinstance(data, list):
         lst = data
+        name_part = (f"{name}" if name else "")
         if len(lst) == 0:
-            name_part = (f"{name}" if name else "")
-            return f"{pad}{name_part}[0]:"
+            out.append(f"{pad}{name_part}[0]:")
+            return
         all_dicts, cols = _all_dicts_with_same_keys(lst)
         if all_dicts:
             header = "{" + ",".join(cols) + "}"
-            name_part = (f"{name}" if name else "")
             # If name provided, include it; otherwise just do header with length
-            if name_part:
-                out_lines.append(f"{pad}{name_part}[{len(lst)}]{header}:")
-            else:
-                out_lines.append(f"{pad}[{len(lst)}]{header}:")
-            for item in lst:
-                row_vals = [_format_value(item[c]) for c in cols]
-                out_lines.append(f"{pad}{','.join(row_vals)}")
-            return "\n".join(out_lines)
+            out.append(f"{pad}{name_part}[{len(lst)}]{header}:")
+            out.append(_tabular_rows(lst, cols, pad))
         elif all(_is_primitive(el) for el in lst):
             vals = [_format_value(el) for el in lst]
-            name_part = (f"{name}" if name else "")
-            if name_part:
-                out_lines.append(f"{pad}{name_part}[{len(lst)}]: {','.join(vals)}")
-            else:
-                out_lines.append(f"{pad}[{len(lst)}]: {','.join(vals)}")
-            return "\n".join(out_lines)
+            out.append(f"{pad}{name_part}[{len(lst)}]: {','.join(vals)}")
         else:
             # mixed elements
-            name_part = (f"{name}" if name else "")
-            out_lines.append(f"{pad}{name_part}[{len(lst)}]:")
+            out.append(f"{pad}{name_part}[{len(lst)}]:")
             for el in lst:
                 if _is_primitive(el):
-                    out_lines.append(f'{" " * (indent + 2)}{_format_value(el)}')
+                    out.append(f"{child_pad}{_format_value(el)}")
                 else:
-                    out_lines.append(json_to_toon(el, name=None, indent=indent + 2))
-            return "\n".join(out_lines)
+                    _to_toon(el, out, indent + 2)
+        return
 
     # Primitive scalar at top-level
     if _is_primitive(data):
         if name:
-            return f"{pad}{name}: {_format_value(data)}"
+            out.append(f"{pad}{name}: {_format_value(data)}")
         else:
-            return f"{pad}{_format_value(data)}"
+            out.append(f"{pad}{_format_value(data)}")
+        return
 
     # Fallback: dump JSON in quotes
-    txt = json.dumps(data, separators=(',', ':'))
+    txt = orjson.dumps(data).decode()
     if name:
-        return f'{pad}{name}: "{txt}"'
+        out.append(f'{pad}{name}: "{txt}"')
     else:
-        return f'{pad}"{txt}"'
+        out.append(f'{pad}"{txt}"')
+
+def json_to_toon(data: Any, name: str = None, indent: int = 0) -> str:
+    """
+    Convert a Python object (from json.loads) into TOON format.
+    - name: optional name for the current node (used for top-level object keys)
+    - indent: internal use, number of spaces to indent nested blocks
+    Returns a TOON-format string.
+    """
+    out: List[str] = []
+    _to_toon(data, out, indent, name)
+    return "\n".join(out)
 
 # Convenience wrapper that accepts a JSON string or a Python object
 def convert_json_to_toon(obj_or_json: Any) -> str:
     """
     If input is a string, it will be parsed as JSON. Otherwise it must be a Python object
     (dict/list/primitive) like the result of json.loads(...).
+    Strings that are not a JSON object or array (e.g. plain retrieved text) are returned unchanged.
     Returns TOON-format string.
     """
     if isinstance(obj_or_json, str):
-        parsed = json.loads(obj_or_json)
+        if not _JSON_START_RE.match(obj_or_json):
+            return obj_or_json
+        try:
+            parsed = orjson.loads(obj_or_json)
+        except orjson.JSONDecodeError:
+            # Plain text that merely starts with '{' or '[' (e.g. a markdown link)
+            return obj_or_json
     else:
         parsed = obj_or_json
     # If top-level is a dict, we convert directly